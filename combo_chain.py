@@ -1,8 +1,14 @@
 import json
 from collections import Counter
+from contextlib import contextmanager
 
 class Node():
+    # slots keep the per-node state compact, and every attribute assignment can be recorded
+    # on the chain's trail so it can be rolled back (see ComboChain.checkpoint)
+    __slots__ = ('id', '_traits', '_nunknown', 'nknown', 'solved', 'poss_tsets', 'poss_traits', 'force_print', '_iknown_lexico', '_trail')
+
     def __init__(self, node:dict, id:int) -> None:
+        object.__setattr__(self, '_trail', None)  # no trail yet, so nothing to record
         self.id = id  # use id to ensure the hashing is unique
         self._traits:list = node['open_traits'].copy()
         self._traits.extend(node['hidden_traits'])
@@ -14,12 +20,28 @@ class Node():
         self.force_print:bool = False
         self._iknown_lexico:int = -1  # index into known traits of element which determines lexicographical ordering
     
+    def __setattr__(self, name:str, value):
+        # attributes are only ever replaced, never mutated in place, so saving the old value is enough to undo
+        trail = getattr(self, '_trail', None)
+        if trail is not None:
+            trail.append((self, name, getattr(self, name)))
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # copies and pickles don't belong to the chain's checkpoints, so leave the trail out
+        return {name: getattr(self, name) for name in self.__slots__ if name != '_trail'}
+
+    def __setstate__(self, state:dict):
+        object.__setattr__(self, '_trail', None)
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
     def __hash__(self):
-        return hash(str(self.id) + str(self.given_traits))
+        return self.id
     
     def __eq__(self, other):
         if type(self) == type(other):
-            return self.id == other.id and all(self._traits == other._traits)
+            return self.id == other.id and self._traits == other._traits
         else:
             return False
     
@@ -142,26 +164,29 @@ class Node():
                         iset_to_del.append(iset)
                         break
         
-        for iset in sorted(iset_to_del, reverse=True):
-            del self.poss_tsets[iset]
+        if iset_to_del:
+            self.poss_tsets = [tset for iset, tset in enumerate(self.poss_tsets) if iset not in iset_to_del]
     
     def set_solved(self, tset:tuple):
         self.solved = True
         self.force_print = True
+        traits = self._traits.copy()
         ind = 0
-        for itrait, trait in enumerate(self._traits):
+        for itrait, trait in enumerate(traits):
             if trait == '?':
-                self._traits[itrait] = tset[ind]
+                traits[itrait] = tset[ind]
                 ind += 1
         
         # ensure lexicographical sorting
-        self._traits.sort()
+        self._traits = sorted(traits)
     
     def set_trait(self, trait_to_set:str)->bool:
         set_solved = False
         for itrait, trait in enumerate(self._traits):
             if trait == '?':
-                self._traits[itrait] = trait_to_set
+                traits = self._traits.copy()
+                traits[itrait] = trait_to_set
+                self._traits = traits
                 self._nunknown -= 1
 
                 if self._nunknown > 0:
@@ -179,15 +204,49 @@ class Node():
             poss_traits.update(tset[-self._nunknown:])
         self.poss_traits = list(poss_traits)
 
+    def get_state(self)->dict:
+        """get the mutable node state as a json-serializable dict"""
+        return {
+            'traits': self._traits.copy(),
+            'nunknown': self._nunknown,
+            'solved': self.solved,
+            'poss_tsets': None if self.poss_tsets is None else [list(t) for t in self.poss_tsets],
+            'poss_traits': None if self.poss_traits is None else sorted(self.poss_traits),
+            'force_print': self.force_print,
+            'iknown_lexico': self._iknown_lexico,
+        }
+
+    def set_state(self, state:dict):
+        """restore the mutable node state from a dict made by get_state"""
+        self._traits = list(state['traits'])
+        self._nunknown = state['nunknown']
+        self.solved = state['solved']
+        self.poss_tsets = None if state['poss_tsets'] is None else [tuple(t) for t in state['poss_tsets']]
+        self.poss_traits = None if state['poss_traits'] is None else list(state['poss_traits'])
+        self.force_print = state['force_print']
+        self._iknown_lexico = state['iknown_lexico']
+
+    def set_trail(self, trail:list):
+        """start (or with None, stop) recording attribute changes on the trail"""
+        object.__setattr__(self, '_trail', trail)
+
+    def restore(self, name:str, value):
+        """set an attribute back to a value from the trail without recording it"""
+        object.__setattr__(self, name, value)
+
 
 class ComboChain():
     def __init__(self, json_file:str='player.json', diff:int=6) -> None:
         self._json_file = json_file
         self._json = None
-        self._nodes:dict[Node, list] = {}
+        self._diff = diff
+        self._nodes:list[Node] = []  # indexed by node id
+        self._crew:list = []  # crew lists of each node, indexed by node id
         self._hidden_traits:list[str] = []
         self.req_traits:dict = {}
         self.solution_ids:list[int] = []
+        self._trail:list = None  # (node, attribute, old value) for every node change since the first checkpoint
+        self._checkpoints:list[tuple] = []
 
         self._load_json(diff)
         self._build_nodes_from_json()
@@ -195,36 +254,109 @@ class ComboChain():
         self._get_required_traits()
 
     def __iter__(self):
-        for k in self._nodes.keys():
-            yield k
+        for node in self._nodes:
+            yield node
 
     def __getitem__(self, idx):
-        return self._nodes[idx]
+        return self._crew[self._node_id(idx)]
     
     def __setitem__(self, idx, val):
         # don't allow creation of nodes
-        if idx in self._nodes:
-            self._nodes[idx] = val
+        inode = self._node_id(idx)
+        if 0 <= inode < len(self._crew):
+            self._crew[inode] = val
     
     def items(self):
-        return self._nodes.items()
+        return zip(self._nodes, self._crew)
     
     def __len__(self):
         return len(self._nodes)
     
+    @staticmethod
+    def _node_id(idx)->int:
+        return idx.id if isinstance(idx, Node) else idx
+
+    def get_node(self, inode:int)->Node:
+        return self._nodes[inode]
+
     def _load_json(self, diff:int):
+        self._json = self._read_combo(diff)
+
+    def _read_combo(self, diff:int)->dict:
         with open(self._json_file,'rb') as f:
             data = json.load(f)
 
         # now just grab the combo chain info
         for boss in data['fleet_boss_battles_root']['statuses']:
             if boss['desc_id'] == diff:
-                self._json = boss['combo']
-                break
+                return boss['combo']
+        return None
+
+    def update_from_json(self)->tuple[bool, list[int]]:
+        """re-read the json file and apply only what changed in the combo section
+
+        Newly revealed hidden traits are set on their nodes and taken out of the trait pool,
+        everything else the chain already worked out is kept.
+
+        Returns:
+            tuple[bool, list[int]]: whether the combo section changed, and the archetype ids of the crew
+                that solved a node since the last read (None if it is a different chain, i.e. the
+                trait pool or open traits changed, and the chain must be rebuilt). A file without
+                this difficulty's combo yet counts as unchanged.
+        """
+        try:
+            combo = self._read_combo(self._diff)
+        except KeyError:
+            combo = None
+        old = self._json
+        if combo is None or combo == old:
+            return False, []
+        if combo['traits'] != old['traits'] or len(combo['nodes']) != len(old['nodes']):
+            return True, None
+        if any(new['open_traits'] != prev['open_traits'] for new, prev in zip(combo['nodes'], old['nodes'])):
+            return True, None
+
+        # work out all the changes first so a file missing keys doesn't leave the chain half updated
+        new_solution_ids = []
+        all_revealed = []
+        for new, prev in zip(combo['nodes'], old['nodes']):
+            if 'unlocked_crew_archetype_id' in new and 'unlocked_crew_archetype_id' not in prev:
+                new_solution_ids.append(new['unlocked_crew_archetype_id'])
+            revealed = Counter(t for t in new['hidden_traits'] if t != '?')
+            revealed.subtract(t for t in prev['hidden_traits'] if t != '?')
+            all_revealed.append(revealed)
+
+        for node, new, revealed in zip(self._nodes, combo['nodes'], all_revealed):
+            for trait in revealed:
+                if revealed[trait] > 0:
+                    self.set_node_trait(node, trait)
+            if node.solved and '?' not in new['hidden_traits']:
+                # solved in game, so nothing is left to run, same as a freshly loaded node
+                node.force_print = False
+
+        self.solution_ids.extend(new_solution_ids)
+        self._json = combo
+        return True, new_solution_ids
+
+    def set_node_trait(self, node:Node, trait:str):
+        """set a hidden trait on a node and remove it from the trait pool
+
+        Does nothing if the node already knows the trait (e.g. the solver found it first).
+        """
+        if node.solved or trait in node.known_traits:
+            return
+        if not node.set_trait(trait):
+            # still unsolved, so only keep the tsets with this trait
+            node.poss_tsets = [t for t in node.poss_tsets if trait in t]
+            node.update_poss_traits()
+        self.remove_set_traits([trait])
+        if trait in self.req_traits and self.req_traits[trait] > 0:
+            self.req_traits[trait] -= 1
 
     def _build_nodes_from_json(self):
         for i,node in enumerate(self._json['nodes']):
-            self._nodes[Node(node, i)] = []  # initialize value to empty list of crew
+            self._nodes.append(Node(node, i))
+            self._crew.append([])  # initialize to empty list of crew
             if len(node)>2:
                 self.solution_ids.append(node['unlocked_crew_archetype_id']) 
 
@@ -262,6 +394,68 @@ class ComboChain():
                 if hid_trait != '?':
                     self._hidden_traits.remove(hid_trait)
     
+    def get_state(self)->dict:
+        """get the chain state (nodes, trait pool, required traits) as a json-serializable dict"""
+        return {
+            'nodes': [node.get_state() for node in self._nodes],
+            'hidden_traits': self._hidden_traits.copy(),
+            'req_traits': self.req_traits.copy(),
+        }
+
+    def set_state(self, state:dict):
+        """restore the chain state from a dict made by get_state"""
+        if len(state['nodes']) != len(self._nodes):
+            raise ValueError(f'Saved state has {len(state["nodes"])} nodes but the chain has {len(self._nodes)}')
+        for node, node_state in zip(self._nodes, state['nodes']):
+            node.set_state(node_state)
+        self._hidden_traits = list(state['hidden_traits'])
+        self.req_traits = dict(state['req_traits'])
+
+    def checkpoint(self)->int:
+        """start a checkpoint that rollback returns to
+
+        Node changes are recorded on a trail from here on, so undoing a hypothetical branch
+        costs O(changes) instead of copying the whole chain. Checkpoints can be nested.
+
+        Returns:
+            int: the number of open checkpoints
+        """
+        if self._trail is None:
+            self._trail = []
+            for node in self._nodes:
+                node.set_trail(self._trail)
+        self._checkpoints.append((len(self._trail), self._hidden_traits, self.req_traits.copy(), self._crew.copy()))
+        return len(self._checkpoints)
+
+    def rollback(self):
+        """undo every change made since the last checkpoint and close it"""
+        itrail, self._hidden_traits, self.req_traits, self._crew = self._checkpoints.pop()
+        while len(self._trail) > itrail:
+            node, name, value = self._trail.pop()
+            node.restore(name, value)
+        self._close_checkpoint()
+
+    def commit(self):
+        """keep the changes made since the last checkpoint and close it"""
+        self._checkpoints.pop()
+        self._close_checkpoint()
+
+    def _close_checkpoint(self):
+        # stop recording once no checkpoint can be rolled back to
+        if not self._checkpoints:
+            self._trail = None
+            for node in self._nodes:
+                node.set_trail(None)
+
+    @contextmanager
+    def what_if(self):
+        """explore a hypothetical branch, all changes made to the chain inside the block are undone on exit"""
+        self.checkpoint()
+        try:
+            yield self
+        finally:
+            self.rollback()
+
     def build_poss_tsets(self, lexico:bool=True):
         for node in self._nodes:
             node.build_poss_tsets(self._hidden_traits, lexico=lexico)
@@ -308,21 +502,20 @@ class ComboChain():
                     node.poss_traits = [ t  for t in node.poss_traits if t not in traits_to_remove ]
                     node.poss_tsets = [ t  for t in node.poss_tsets if t not in tsets_to_remove ]
     
-    def update(self, solutions:[list[tuple[tuple[str]]]])->bool:
-        inode = 0
+    def update(self, keep_tsets:list[set[int]])->bool:
+        """keep only the possible tsets used by a valid full solution
+
+        Args:
+            keep_tsets (list[set[int]]): indices into poss_tsets to keep for each unsolved node
+
+        Returns:
+            bool: True if any tsets were eliminated
+        """
         reduced_poss_tsets = False
-        for node in self._nodes:
-            # need to see if the eliminated tsets actually reduced the trait pool
-            old_poss_tsets = node.poss_tsets.copy()
-            if node.solved:
-                continue
-            node.poss_tsets = []
-            for soln in solutions:
-                if soln[inode] not in node.poss_tsets:
-                    node.poss_tsets.append(soln[inode])
-
-            inode += 1
-            diff = [ True for x in old_poss_tsets if x not in node.poss_tsets]
-            reduced_poss_tsets |= any(diff)
+        unsolved = [node for node in self._nodes if not node.solved]
+        for node, keep in zip(unsolved, keep_tsets):
+            if len(keep) < len(node.poss_tsets):
+                node.poss_tsets = [tset for itset, tset in enumerate(node.poss_tsets) if itset in keep]
+                reduced_poss_tsets = True
         
-        return reduced_poss_tsets
\ No newline at end of file
+        return reduced_poss_tsets
@@ -1,6 +1,8 @@
 from solver import Solver
 
 verbose = False
+time_budget = None  # seconds, None for no limit
+watch = False  # keep running and re-solve whenever player.json changes
 
 # add attempted crew to this list as strings
 att_crew = [
@@ -12,4 +14,7 @@ player_json = 'player.json'
 s = Solver(player_json=player_json, diff='unm' ,min_portal=2, max_portal=5, req_lexico=True)
 
 # solve the chain with these attempted crew
-s.solve(att_crew, verbose=verbose)
\ No newline at end of file
+if watch:
+    s.watch(att_crew, verbose=verbose, time_budget=time_budget)
+else:
+    s.solve(att_crew, verbose=verbose, time_budget=time_budget)
\ No newline at end of file
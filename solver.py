@@ -1,9 +1,12 @@
 import json
+import os
+import time
 
 from combo_chain import ComboChain
 from traitdb.sttcrew import TraitSetDB
-from copy import deepcopy
 from collections import Counter
+from contextlib import contextmanager
+from itertools import islice, product
 # from crew_battle_actions import CrewBattleActionDB, CrewBattleAction
 
 class Solver():
@@ -12,7 +15,7 @@ class Solver():
     A class to solve a combo chain given a trait set database
     '''
     boss_to_id = { 'easy':(1,1,2,2,4), 'normal':(2,1,3,2,4), 'hard':(3,1,4,2,4), 'brutal':(4,1,4,2,4), 'nm':(5,1,5,3,4), 'unm':(6,1,5,3,4)}
-    def __init__(self, player_json:str='player.json', crew_json:str='crew.json', diff:str='unm', min_portal:int=2, max_portal:int=5, inc_non_portal:bool=True, req_lexico:bool=True) -> None:
+    def __init__(self, player_json:str='player.json', crew_json:str='crew.json', diff:str='unm', min_portal:int=2, max_portal:int=5, inc_non_portal:bool=True, req_lexico:bool=True, chunk_size:int=10000) -> None:
         """Initializer for FBB combo chain solver
 
         Args:
@@ -22,9 +25,13 @@ class Solver():
             max_portal (int, optional): maximum number of matching portal crew for a valid trait set. Defaults to 5.
             inc_non_portal (bool, optional): add matching non-portal crew to the solution lists. Defaults to True.
             req_lexico (bool, optional): require lexicographical ordering of the traits. Defaults to True.
+            chunk_size (int, optional): number of full solutions generated and validated at a time. Defaults to 10000.
         """
+        if chunk_size < 1:
+            raise ValueError(f'chunk_size must be at least 1, got {chunk_size}')
         self.diff, self.min_stars, self.max_stars, self.min_set_size, self.max_set_size = self.boss_to_id[diff]
         self._traitdb = TraitSetDB(nmin=self.min_set_size, nmax=self.max_set_size, maxrarity=self.max_stars, add_portal_only=True, crewfile=crew_json)  # copies let us manipulate the db without destroying the originals
+        self._player_json = player_json
         self._chain = ComboChain(player_json, self.diff)
         self._lexico = req_lexico
         self._matching_crew:list[dict] = [] 
@@ -33,6 +40,11 @@ class Solver():
         self._node_solutions:list[str] = []
         self.niters:int = 0
         self.maxiters:int = 10
+        self.chunk_size:int = chunk_size  # number of combinations checked at a time, bounds the memory of the full solution search
+        self.cut_short:list[str] = []  # passes that were stopped early by the deadline or maxiters
+        self._deadline:float = None
+        self._tsets_built:bool = False
+        self._full_soln_progress:dict = None  # saved state of a full solution search that ran out of time
         self.nportal:(tuple) = (min_portal, max_portal)
         self._load_trait_translation()
 
@@ -46,6 +58,81 @@ class Solver():
         if self._chain.solution_ids:
             self._node_solutions.extend(self._traitdb.get_solved_node_crew(self._chain.solution_ids))
     
+    def refresh(self)->tuple[bool, list[str]]:
+        """re-read player.json and update only the parts of the chain that changed
+
+        Revealed traits and newly solved nodes are applied to the current chain state, so the
+        next solve only has to propagate them. A different chain is rebuilt from scratch.
+
+        Returns:
+            tuple[bool, list[str]]: whether the chain changed, and the crew that solved a node
+                since the last read (None if the chain was rebuilt)
+        """
+        changed, new_solution_ids = self._chain.update_from_json()
+        if not changed:
+            return False, []
+        
+        self._full_soln_progress = None
+        if new_solution_ids is None:
+            self._chain = ComboChain(self._player_json, self.diff)
+            self._tsets_built = False
+            self._node_solutions = []
+            if self._chain.solution_ids:
+                self._node_solutions.extend(self._traitdb.get_solved_node_crew(self._chain.solution_ids))
+            return True, None
+
+        new_crew = []
+        if new_solution_ids:
+            new_crew = self._traitdb.get_solved_node_crew(new_solution_ids)
+            self._node_solutions.extend(new_crew)
+            if self._tsets_built:
+                self._chain.remove_tried_tsets(new_crew, self._traitdb)
+        return True, new_crew
+
+    def watch(self, att_crew:list[str]=[], verbose=False, time_budget:float=None, poll_interval:float=0.2):
+        """solve the chain, then re-solve every time player.json changes until interrupted (Ctrl-C)
+
+        Args:
+            att_crew (list[str], optional): attempted crew to eliminate. Defaults to [].
+            verbose (bool, optional): print the chain after each step. Defaults to False.
+            time_budget (float, optional): seconds to spend on each solve. Defaults to None (no limit).
+            poll_interval (float, optional): seconds between checks of the file. Defaults to 0.2.
+        """
+        given_att_crew = att_crew.copy()
+        att_crew = att_crew.copy()
+        last_stat = self._stat_player_json()
+        self.solve(att_crew, verbose=verbose, time_budget=time_budget)
+        try:
+            while True:
+                time.sleep(poll_interval)
+                stat = self._stat_player_json()
+                if stat is None or stat == last_stat:
+                    continue
+                try:
+                    changed, new_crew = self.refresh()
+                except (ValueError, KeyError):
+                    # caught the file mid-write, try again on the next poll
+                    continue
+                last_stat = stat
+                if not changed:
+                    continue
+
+                print(f'\n{self._player_json} changed, re-solving')
+                if new_crew is None:
+                    att_crew = given_att_crew.copy()
+                else:
+                    att_crew.extend(new_crew)
+                self.solve(att_crew, verbose=verbose, time_budget=time_budget)
+        except KeyboardInterrupt:
+            print('\nStopped watching.')
+
+    def _stat_player_json(self)->tuple[int, int]:
+        try:
+            stat = os.stat(self._player_json)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
     def print_settings(self, att_crew:list[str]):
         """Print the solver settings for sharing"""
         print('FBB Chain Solver Settings')
@@ -59,16 +146,33 @@ class Solver():
             self._trait_translation = json.load(f)
         self._trait_translation = self._trait_translation['trait_names']
     
-    def solve(self, att_crew:list[str]=[], verbose=False):
+    def solve(self, att_crew:list[str]=[], verbose=False, time_budget:float=None)->dict:
         """solve the combo chain
+
+        Calling solve again (or after load_state) resumes from the current chain state,
+        including a full solution search that was cut short.
+
+        Args:
+            att_crew (list[str], optional): attempted crew to eliminate. Defaults to [].
+            verbose (bool, optional): print the chain after each step. Defaults to False.
+            time_budget (float, optional): seconds to spend before returning the best result so far. Defaults to None (no limit).
+
+        Returns:
+            dict: the reduced chain, see get_result
         """
+        self.niters = 0  # maxiters applies to each call
+        self.cut_short = []
+        self._deadline = None if time_budget is None else time.monotonic() + time_budget
 
         # start by building all possible tsets
         chain = self._chain
-        chain.build_poss_tsets(lexico=self._lexico)
+        if not self._tsets_built:
+            chain.build_poss_tsets(lexico=self._lexico)
 
-        if self._node_solutions:
-            att_crew.extend(self._node_solutions)
+            if self._node_solutions:
+                att_crew.extend(self._node_solutions)
+            self._tsets_built = True
+        # attempted crew can be added on any call, removing them again is harmless
         if att_crew:
             chain.remove_tried_tsets(att_crew, self._traitdb)
         
@@ -81,12 +185,18 @@ class Solver():
                 for i,node in enumerate(chain,start=1):
                     node.print(i, self._trait_translation)
                     print(node.poss_tsets)
+            if self._out_of_time('traitdb'):
+                break
             keep_going |= self._check_against_traitdb(verbose=verbose)
             if verbose: print('\n-----\njust checked against trait db')
 
+            if self._out_of_time('required traits'):
+                break
             keep_going |= self._analyze_required_traits(verbose=verbose)
             if verbose: print('\n-----\njust analyzed required traits')
             
+            if self._out_of_time('guaranteed traits'):
+                break
             keep_going |= self._check_nodes_for_guaranteed_traits(verbose=verbose)
             if verbose: print('\n-----\njust checked for guaranteed to be used traits')
 
@@ -97,6 +207,7 @@ class Solver():
             self.niters += 1
             if self.niters > self.maxiters:
                 print(f'\nIteration #{self.niters}')
+                self.cut_short.append('maxiters')
                 break
             else:
                 pass
@@ -107,6 +218,8 @@ class Solver():
 
                 # maybe rebuild poss traits and tsets here for next round?
         
+        if self.cut_short:
+            print('\nStopped early, passes cut short: ' + ', '.join(self.cut_short))
         print('\nDone solving. Finding matching crew...')
         self._build_crew_lists()
         print('Simplifying the matching crew lists')
@@ -116,13 +229,107 @@ class Solver():
         
         self.print_settings(att_crew)
         self.print_solution()
+
+        return self.get_result()
+
+    def get_result(self)->dict:
+        """get the current reduced chain
+
+        Returns:
+            dict: 'complete' is False if any pass was cut short, 'cut_short' lists those passes and
+                'poss_tsets' has the possible trait sets of each node (None for solved nodes)
+        """
+        return {
+            'complete': not self.cut_short,
+            'cut_short': self.cut_short.copy(),
+            'poss_tsets': [None if node.solved else node.poss_tsets.copy() for node in self._chain],
+        }
+
+    def save_state(self, fname:str):
+        """save the solver progress to a json file so solving can be resumed later with load_state"""
+        progress = self._full_soln_progress
+        if progress is not None:
+            progress = {
+                'poss_tsets': [[list(tset) for tset in tsets] for tsets in progress['poss_tsets']],
+                'nchecked': progress['nchecked'],
+                'keep_tsets': [sorted(keep) for keep in progress['keep_tsets']],
+                'made_changes': progress['made_changes'],
+            }
+        state = {
+            'chain': self._chain.get_state(),
+            'cut_short': self.cut_short,
+            'full_soln_progress': progress,
+        }
+        with open(fname, 'w') as f:
+            json.dump(state, f)
+
+    def load_state(self, fname:str):
+        """load solver progress saved by save_state, the next call to solve picks up from there"""
+        with open(fname, 'rb') as f:
+            state = json.load(f)
+        self._chain.set_state(state['chain'])
+        self.cut_short = state['cut_short']
+        progress = state['full_soln_progress']
+        if progress is not None:
+            progress['poss_tsets'] = [[tuple(tset) for tset in tsets] for tsets in progress['poss_tsets']]
+            progress['keep_tsets'] = [set(keep) for keep in progress['keep_tsets']]
+        self._full_soln_progress = progress
+        self._tsets_built = True
+
+    @contextmanager
+    def what_if(self):
+        """explore a hypothetical branch, e.g. with assume_crew or assume_trait followed by solve
+
+        Every change to the chain and the solver progress made inside the block is undone on exit.
+        """
+        progress = self._full_soln_progress
+        if progress is not None:
+            progress = dict(progress, keep_tsets=[keep.copy() for keep in progress['keep_tsets']])
+        saved = (self.cut_short, self._tsets_built, progress)
+        with self._chain.what_if():
+            try:
+                yield self
+            finally:
+                self.cut_short, self._tsets_built, self._full_soln_progress = saved
+
+    def assume_crew(self, inode:int, crew:str):
+        """assume the crew succeeds on a node, keeping only the node's trait sets the crew matches
+
+        Args:
+            inode (int): id of the node (0-based)
+            crew (str): name of the crew
+        """
+        node = self._chain.get_node(inode)
+        if node.solved:
+            return
+        node.poss_tsets = [t for t in node.poss_tsets if t in self._traitdb and crew in self._traitdb[t]]
+        node.update_poss_traits()
+
+    def assume_trait(self, inode:int, trait:str):
+        """assume a node uses a hidden trait
+
+        Args:
+            inode (int): id of the node (0-based)
+            trait (str): the trait the node uses
+        """
+        self._chain.set_node_trait(self._chain.get_node(inode), trait)
+
+    def _out_of_time(self, pass_name:str)->bool:
+        """check the deadline, flagging the pass as cut short if it has passed"""
+        if self._deadline is None or time.monotonic() < self._deadline:
+            return False
+        self.cut_short.append(pass_name)
+        return True
     
     def _check_full_solutions(self)->bool:
         """
         Check for consistency of possible trait sets across all nodes
-        """
-        made_changes = False
 
+        The combinations are generated and validated in chunks of chunk_size, keeping only the
+        indices of the tsets of each node used by a valid solution, so memory stays flat however
+        many combinations there are. The search stops between chunks once the deadline has
+        passed, and the progress is kept so the search can resume.
+        """
         poss_tsets = []
         istart = []
         for node in self._chain:
@@ -132,40 +339,51 @@ class Solver():
             # else:
             #     poss_tsets = tuple(node.traits[-len(node.given_traits):])
             #     istart.append(len(node.given_traits))
+
+        # pick up a search that was cut short, as long as the chain hasn't changed since
+        progress = self._full_soln_progress
+        self._full_soln_progress = None
+        if progress is None or progress['poss_tsets'] != poss_tsets:
+            progress = {'poss_tsets': [tsets.copy() for tsets in poss_tsets], 'nchecked': 0, 'keep_tsets': [set() for _ in poss_tsets], 'made_changes': False}
+        keep_tsets = progress['keep_tsets']
         
         # now we have all the poss tsets in a nicely iterable data structure (list of lists)
-        combs = self._generate_all_combinations(poss_tsets, istart)
-        valid_solns, made_changes = self._check_solutions(combs)
+        combs = generate_combinations(poss_tsets, istart)
+        for chunk in iter_chunks(combs, self.chunk_size, nskip=progress['nchecked']):
+            if self._out_of_time('full solutions'):
+                self._full_soln_progress = progress
+                return False
+            progress['made_changes'] |= self._check_solutions(chunk, keep_tsets)
+            progress['nchecked'] += len(chunk)
+            if all(len(keep) == len(tsets) for keep, tsets in zip(keep_tsets, poss_tsets)):
+                # every tset is already in a valid solution, so nothing can be eliminated
+                return False
+
+        made_changes = progress['made_changes']
         if made_changes:  # the solution checked eliminated some trait sets, but did it actually simplify?
-            made_changes = self._chain.update(valid_solns)
+            made_changes = self._chain.update(keep_tsets)
 
         return made_changes
     
-    def _generate_all_combinations(self, poss_tsets:list[list[tuple[str]]], istart:list[int])->list:
-        potential_solns = []
-        curr = []
-        generate_combinations(poss_tsets, potential_solns, istart, 0, curr)
-        return potential_solns
-    
-    def _check_solutions(self, potential_solns:list[str])->list[str]:
-        """validate a list of potential solutions against the chain's required and hidden traits 
+    def _check_solutions(self, potential_solns:list[tuple[tuple[int, tuple[str]]]], keep_tsets:list[set[int]])->bool:
+        """validate a chunk of potential solutions against the chain's required and hidden traits 
 
         Args:
-            potential_solns (list[tuple[tuple[str]]]): _description_
+            potential_solns (list[tuple[tuple[int, tuple[str]]]]): (tset index, hidden traits) of each unsolved node for each potential solution
+            keep_tsets (list[set[int]]): indices of the tsets used by a valid solution for each unsolved node, updated in place
 
         Returns:
-            list[tuple[tuple[str]]]: _description_
+            bool: whether any potential solutions were eliminated
         """
         made_changes = False
-        valid_solns = []
         req_traits = self._chain.req_traits
         check_req_traits = sum(req_traits.values()) > 0
         for soln in potential_solns:
             keep = True
             cnt = Counter()
             # loop over the traits from each node and add to the counter
-            for node in soln:
-                cnt.update(node)
+            for _, hidden in soln:
+                cnt.update(hidden)
             
             # now check for validity
             for trait in cnt:
@@ -183,26 +401,10 @@ class Solver():
                     break
                 
             if keep:
-                valid_solns.append(soln)
-
-        # nothing eliminated, we're done
-        if not made_changes:
-            return potential_solns, made_changes
+                for keep_node, (itset, _) in zip(keep_tsets, soln):
+                    keep_node.add(itset)
 
-        # add back the given traits for a full tset
-        given_traits = []
-        for node in self._chain:
-            if not node.solved:
-                given_traits.append(node.given_traits)
-        
-        valid_full_solns = []
-        for soln in valid_solns:
-            this_full_soln = []
-            for given, hidden in zip(given_traits, soln):
-                this_full_soln.append(tuple(given,)+hidden)
-            valid_full_solns.append(this_full_soln)
-
-        return valid_full_solns, made_changes
+        return made_changes
 
     def _check_against_traitdb(self, verbose:bool=False):
         """
@@ -375,14 +577,16 @@ class Solver():
             plural = 's' if count != 1 else ''
             print(f'{self._trait_translation[trait]} should be used {count} more time' + plural)
 
-def generate_combinations(poss_tsets:list[list[tuple[str]]], combinations:list[tuple[tuple[str]]], istart:list[int], depth:int, curr:list[tuple[str]]):
-    if depth == len(poss_tsets):
-        # reach the end of the list of lists, add this combination
-        combinations.append(tuple(curr))
-        return
-    
-    # not at the end, add a tset and go one level deeper
-    for set in poss_tsets[depth]:
-        next = curr.copy()  # these are objects, so make copies, could probably pop as well
-        next.append(set[istart[depth]:])
-        generate_combinations(poss_tsets, combinations, istart, depth+1, next)
\ No newline at end of file
+def generate_combinations(poss_tsets:list[list[tuple[str]]], istart:list[int]):
+    """lazily generate every combination of one tset per node as (tset index, hidden traits) pairs"""
+    hidden_tsets = [[(itset, tset[i:]) for itset, tset in enumerate(tsets)] for tsets, i in zip(poss_tsets, istart)]
+    return product(*hidden_tsets)
+
+def iter_chunks(iterable, chunk_size:int, nskip:int=0):
+    """yield lists of up to chunk_size items from iterable after skipping the first nskip"""
+    it = islice(iterable, nskip, None)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk